@@ -23,10 +23,12 @@ setup(
         "jinja2>=3.0.3",
         "pyyaml>=6.0",
         "requests>=2.25.1",
+        "urllib3>=1.26.0",
         "click>=8.1.3",
         "cookiecutter>=2.1.1",
         "packaging>=21.3",
         "snakemake==7.15.2",
+        "tqdm>=4.62.0",
     ],
     extras_require={
         "tests": [
@@ -0,0 +1,57 @@
+"""
+A small persistent key-value store backed by SQLite, used to remember the
+results of API requests across builds.
+
+"""
+import sqlite3
+import time
+from contextlib import closing
+
+from . import paths
+
+
+def _connect():
+    """
+    Open a connection to the store, creating it if needed.
+
+    """
+    conn = sqlite3.connect(str(paths.user().temp / "cache.db"), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS kv(k TEXT PRIMARY KEY, v TEXT, ts INTEGER)"
+    )
+    return conn
+
+
+def kv_get(key, ttl=None):
+    """
+    Return the value stored under `key`, or ``None`` if there is no such
+    entry or if it is older than `ttl` seconds.
+
+    Args:
+        key (str): The key to look up.
+        ttl (int, optional): Maximum age of the entry in seconds. Entries
+            never expire if this is ``None``.
+
+    """
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT v, ts FROM kv WHERE k = ?", (key,)
+        ).fetchone()
+    if row is None:
+        return None
+    value, ts = row
+    if ttl is not None and time.time() - ts > ttl:
+        return None
+    return value
+
+
+def kv_put(key, value):
+    """
+    Store the string `value` under `key`.
+
+    """
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO kv VALUES (?, ?, ?)",
+            (key, value, int(time.time())),
+        )
@@ -14,7 +14,7 @@ import types
 
 from . import exceptions, paths
 from .logging import ColorizingStreamHandler, get_logger
-from .zenodo import Zenodo
+from .zenodo import Zenodo, get_deposit
 
 try:
     import snakemake
@@ -471,7 +471,7 @@ def job_is_cached(job):
             """
             if doi:
                 try:
-                    Zenodo(doi).download_file(
+                    get_deposit(doi).download_file(
                         cachefile, job.rule.name, dry_run=True
                     )
                     return True
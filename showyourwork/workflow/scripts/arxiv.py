@@ -4,37 +4,108 @@ tars everything in the ``src/tex`` directory into the tarball
 ``arxiv.tar.gz`` for easy arXiv submission.
 
 """
+import gzip
+import importlib.util
+import os
+import shutil
+import subprocess
 import tarfile
 
 from showyourwork import paths
 
+
+def walk_files(root):
+    """
+    Recursively yield the paths of all files under ``root``, in sorted
+    order.
+
+    """
+    with os.scandir(root) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            elif not entry.is_dir():
+                yield entry.path
+
+
+def reset_tarinfo(tarinfo):
+    """
+    Strip the owner and timestamp from a tarball member so the tarball is
+    reproducible.
+
+    """
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    tarinfo.mtime = 0
+    return tarinfo
+
+
 if __name__ == "__main__":
 
     # Snakemake config (available automagically)
     config = snakemake.config  # type:ignore
 
-    # Hack to run the `pdf.py` script
-    script = __file__.replace("arxiv.py", "pdf.py")
-    with open(script, "r") as f:
-        script = f.read()
-    exec(script)
+    # Run the `pdf.py` script as if it were the main module
+    spec = importlib.util.spec_from_file_location(
+        "__main__", os.path.join(os.path.dirname(__file__), "pdf.py")
+    )
+    pdf = importlib.util.module_from_spec(spec)
+    pdf.snakemake = snakemake  # type:ignore
+    spec.loader.exec_module(pdf)
 
     # File names to exclude
     ms_name = snakemake.config["ms_name"]
-    exclude = [
-        ".gitignore",
-        f"{ms_name}.pdf",
-        f"{ms_name}.aux",
-        f"{ms_name}.blg",
-        f"{ms_name}.log",
-        f"{ms_name}.out",
-    ]
-
-    # Tar up everything in the src/tex directory
-    with tarfile.open("arxiv.tar.gz", "w:gz") as tarball:
-        for file in paths.user().tex.rglob("*"):
-            if not file.is_dir() and not file.name in exclude:
-                tarball.add(file, arcname=file.relative_to(paths.user().tex))
-        for file in paths.user().compile.rglob("*"):
-            if file.name not in exclude:
-                tarball.add(file, arcname=file.name)
+    exclude = frozenset(
+        [
+            ".gitignore",
+            f"{ms_name}.pdf",
+            f"{ms_name}.aux",
+            f"{ms_name}.blg",
+            f"{ms_name}.log",
+            f"{ms_name}.out",
+        ]
+    )
+
+    # Tar up everything in the src/tex directory. The tarball is streamed
+    # through `pigz` to compress it on all cores if it's available,
+    # falling back to single-threaded gzip otherwise. Timestamps are
+    # omitted so that the output is reproducible
+    with open("arxiv.tar.gz", "wb") as out:
+        pigz = shutil.which("pigz")
+        if pigz:
+            proc = subprocess.Popen(
+                [pigz, "-p", str(os.cpu_count() or 1), "-c", "-n"],
+                stdin=subprocess.PIPE,
+                stdout=out,
+            )
+            stream = proc.stdin
+        else:
+            proc = None
+            stream = gzip.GzipFile(
+                filename="", fileobj=out, mode="wb", mtime=0
+            )
+        with stream, tarfile.open(
+            fileobj=stream, mode="w|", format=tarfile.GNU_FORMAT
+        ) as tarball:
+            tex = paths.user().tex
+            for file in walk_files(tex):
+                name = os.path.basename(file)
+                if name not in exclude:
+                    tarball.add(
+                        file,
+                        arcname=os.path.relpath(file, tex),
+                        recursive=False,
+                        filter=reset_tarinfo,
+                    )
+            for file in walk_files(paths.user().compile):
+                name = os.path.basename(file)
+                if name not in exclude:
+                    tarball.add(
+                        file,
+                        arcname=name,
+                        recursive=False,
+                        filter=reset_tarinfo,
+                    )
+        if proc is not None and proc.wait():
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
@@ -2,11 +2,11 @@
 Downloads a publically available file from a Zenodo or Zenodo Sandbox record.
 
 """
-import subprocess
+import requests
 
 from showyourwork import exceptions
 from showyourwork.logging import get_logger
-from showyourwork.zenodo import Zenodo
+from showyourwork.zenodo import Zenodo, http_session, progress
 
 if __name__ == "__main__":
 
@@ -21,20 +21,25 @@ if __name__ == "__main__":
     # Initialize the logger
     logger = get_logger()
 
-    # Get the zenodo interface
-    deposit = Zenodo(doi)
+    # Get the deposit location (no need to authenticate)
+    _, deposit_id, url = Zenodo.parse_doi(doi)
 
     # Download it
-    progress_bar = ["--progress-bar"] if not config["github_actions"] else []
-    result = subprocess.run(
-        [
-            "curl",
-            "-f",
-            f"https://{deposit.url}/record/{deposit.deposit_id}/files/{remote_file}",
-            *progress_bar,
-            "--output",
-            output,
-        ]
-    )
-    if result.returncode != 0:
+    try:
+        with http_session() as session, session.get(
+            f"https://{url}/record/{deposit_id}/files/{remote_file}",
+            stream=True,
+        ) as r:
+            r.raise_for_status()
+            total = int(r.headers.get("Content-Length", 0)) or None
+            with open(output, "wb") as f:
+                with progress(
+                    f,
+                    "write",
+                    total,
+                    github_actions=config["github_actions"],
+                ) as out:
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        out.write(chunk)
+    except requests.RequestException:
         raise exceptions.ZenodoDownloadError()
@@ -2,16 +2,29 @@
 Main Zenodo interface.
 
 """
+import atexit
+import base64
+import contextlib
+import functools
+import hashlib
 import json
+import mmap
 import os
 import shutil
-import subprocess
 import tarfile
-from pathlib import Path
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
 import requests
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
 
-from . import exceptions, git, paths
+from . import _kvstore, exceptions, git, paths
 from .config import get_run_type
 from .logging import get_logger
 from .subproc import parse_request
@@ -21,10 +34,167 @@ try:
 except ModuleNotFoundError:
     snakemake = None
 
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
 
 # Supported tarball extensions
 zip_exts = ["tar", "tar.gz", "zip"]
 
+# How long (in seconds) to reuse the list of versions of a deposit
+depositions_ttl = 60
+
+# How long (in seconds) to remember whether the user owns a deposit
+auth_ttl = 86400
+
+# Retry policy for transient server-side errors. File uploads stream
+# their body, so they can't be replayed by the connection pool and are
+# retried explicitly in ``Zenodo._upload`` instead. Once the retries are
+# used up, the last response is returned (rather than raising) so that
+# callers can handle it like any other error status.
+http_retries = Retry(
+    total=5,
+    backoff_factor=0.3,
+    status_forcelist=[500, 502, 503, 504],
+    allowed_methods=["HEAD", "GET", "OPTIONS", "DELETE"],
+    raise_on_status=False,
+)
+
+
+# Files at least this large (in bytes) are downloaded as concurrent byte
+# ranges if the server supports it
+ranged_download_size = 64 * 1024**2
+
+
+def is_retryable_upload(error):
+    """
+    Return True if an upload that failed with `error` should be retried.
+
+    Uploads are retried on the server errors in ``http_retries`` and if the
+    connection broke while the body was being sent. Failures to connect
+    have already been retried by the connection pool, and other errors
+    (e.g., a rejected token or checksum) won't go away on their own.
+
+    """
+    if isinstance(error, requests.HTTPError):
+        return (
+            error.response is not None
+            and error.response.status_code in http_retries.status_forcelist
+        )
+    return not (error.args and isinstance(error.args[0], MaxRetryError))
+
+
+# Tarballs of directories up to this size (in bytes) are built in memory
+# before they are uploaded; larger ones are spooled to a temporary file
+tarball_spool_size = 64 * 1024**2
+
+
+def transfer_workers():
+    """
+    Return the maximum number of concurrent file transfers, set by the
+    environment variable ``SYW_UPLOAD_WORKERS`` (default 8).
+
+    The HTTP connection pool is sized to match, so that every concurrent
+    transfer can keep its connection alive for the next one.
+
+    """
+    return int(os.getenv("SYW_UPLOAD_WORKERS", "8"))
+
+
+def http_session():
+    """
+    Return a ``requests`` session whose connection pool is sized for
+    ``transfer_workers()`` concurrent transfers and which retries failed
+    requests according to ``http_retries``.
+
+    """
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max(16, transfer_workers()),
+            max_retries=http_retries,
+        ),
+    )
+    return session
+
+
+def progress(stream, method, total=None, github_actions=None):
+    """
+    Wrap the `method` of a file-like `stream` with a progress bar, unless
+    we're running on GitHub Actions.
+
+    Args:
+        stream: The file-like object to wrap.
+        method (str): The method to wrap (``"read"`` or ``"write"``).
+        total (int, optional): The total number of bytes, if known.
+        github_actions (bool, optional): Whether we're running on GitHub
+            Actions. Defaults to the value in the workflow config.
+
+    """
+    if github_actions is None:
+        try:
+            github_actions = snakemake.workflow.config["github_actions"]
+        except (AttributeError, KeyError):
+            github_actions = False
+    if github_actions:
+        return contextlib.nullcontext(stream)
+    return tqdm.wrapattr(
+        stream,
+        method,
+        total=total,
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+    )
+
+
+def json_loads(s):
+    """
+    Decode a JSON string, using ``orjson`` if it's installed.
+
+    """
+    if orjson is None:
+        return json.loads(s)
+    return orjson.loads(s)
+
+
+def json_dumps(obj):
+    """
+    Encode an object as a compact JSON string, using ``orjson`` if it's
+    installed.
+
+    """
+    if orjson is None:
+        return json.dumps(obj, separators=(",", ":"))
+    return orjson.dumps(obj).decode()
+
+
+def file_md5(path):
+    """
+    Return the MD5 digest of the file at `path` as raw bytes.
+
+    """
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "md5").digest()
+        md5 = hashlib.md5()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            md5.update(chunk)
+        return md5.digest()
+
+
+def remote_md5(entry):
+    """
+    Return the hex MD5 checksum of a file in a deposit file listing, which
+    may or may not be prefixed with the name of the algorithm.
+
+    """
+    return entry.get("checksum", "").split(":")[-1]
+
 
 def require_access_token(method):
     """
@@ -49,19 +219,11 @@ def get_dataset_urls(files, datasets):
     This is used to populate the figure margin icons in the article.
 
     """
-    result = []
-    for doi in datasets:
-        deposit = Zenodo(doi)
-        url = f"https://{deposit.url}/record/{deposit.deposit_id}"
-        for file in files:
-            if file in datasets[doi]["contents"].values():
-                result.append(url)
-            else:
-                for zip_file in datasets[doi]["zip_files"]:
-                    if file in datasets[doi]["zip_files"][zip_file].values():
-                        result.append(url)
-                        break
-    return list(set(result))
+    result = set()
+    for doi in get_dataset_dois(files, datasets):
+        _, deposit_id, url = Zenodo.parse_doi(doi)
+        result.add(f"https://{url}/record/{deposit_id}")
+    return list(result)
 
 
 def get_dataset_dois(files, datasets):
@@ -70,18 +232,80 @@ def get_dataset_dois(files, datasets):
     DOIs.
 
     """
-    result = []
-    for doi in datasets:
-        deposit = Zenodo(doi)
-        for file in files:
-            if file in datasets[doi]["contents"].values():
-                result.append(doi)
-            else:
-                for zip_file in datasets[doi]["zip_files"]:
-                    if file in datasets[doi]["zip_files"][zip_file].values():
-                        result.append(doi)
-                        break
-    return list(set(result))
+    files = set(files)
+    result = set()
+    for doi, entry in datasets.items():
+        # Check the top-level contents first; only search inside the
+        # zip files if there's no match there
+        if not files.isdisjoint(entry["contents"].values()) or any(
+            not files.isdisjoint(zip_contents.values())
+            for zip_contents in entry["zip_files"].values()
+        ):
+            result.add(doi)
+    return list(result)
+
+
+def get_service(doi):
+    """
+    Return the entry in ``services`` whose DOI prefix matches `doi`.
+
+    Does not make any requests to the API.
+
+    """
+    doi = str(doi)
+    service = services_by_registrant.get(doi.split("/", 1)[0], None)
+    if service is None or not doi.startswith(service["doi_prefix"]):
+        raise exceptions.InvalidZenodoDOI(doi)
+    return service
+
+
+def is_within_directory(directory, target):
+    """
+    Return True if the path `target` is inside `directory`.
+
+    """
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
+    prefix = os.path.commonprefix([abs_directory, abs_target])
+    return prefix == abs_directory
+
+
+def safe_extract(tar, path=".", *, numeric_owner=False):
+    """
+    Extract the tarfile `tar` into `path`, guarding against path traversal.
+
+    Members are validated and extracted one at a time in a single pass over
+    the archive, so this also works for tarballs opened in streaming mode.
+
+    """
+    for member in tar:
+        if not is_within_directory(path, os.path.join(path, member.name)):
+            raise Exception("Attempted Path Traversal in Tar File")
+        tar.extract(member, path, numeric_owner=numeric_owner)
+
+
+class SizedReader:
+    """
+    Minimal read-only file object of known length wrapping `stream`.
+
+    Upload bodies are passed to ``requests`` through this, since it needs
+    the length of the body to set its ``Content-Length`` and can't take it
+    from a memory map wrapped in a progress bar.
+
+    """
+
+    def __init__(self, stream, size):
+        self._stream = stream
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(lambda: self.read(1 << 20), b"")
+
+    def read(self, *args):
+        return self._stream.read(*args)
 
 
 services = {
@@ -101,6 +325,12 @@ services = {
     },
 }
 
+# Services keyed by the registrant code of their DOIs (e.g., "10.5281")
+services_by_registrant = {
+    service["doi_prefix"].split("/")[0]: service
+    for service in services.values()
+}
+
 
 class Zenodo:
     """
@@ -108,6 +338,10 @@ class Zenodo:
 
     """
 
+    # Results of ``check_if_user_is_owner`` for this process, keyed
+    # by ``(url, deposit_id, access_token)``
+    _auth_cache = {}
+
     def __init__(self, doi_or_service, **kwargs):
         """
         Initialize a Zenodo interface.
@@ -118,6 +352,34 @@ class Zenodo:
             kwargs: Forwarded to ``Zenodo._create``.
 
         """
+        # Reuse a single connection pool for all calls to the API
+        self._session = http_session()
+
+        # Cached response of ``Zenodo._get_depositions``
+        self._depositions = None
+
+        # Drafts fetched by ``Zenodo._get_draft``, keyed by URL, along
+        # with their ETags
+        self._drafts = {}
+
+        # Latest draft returned by ``Zenodo._ensure_draft``, shared by
+        # concurrent uploads
+        self._draft = None
+        self._draft_lock = threading.Lock()
+
+        # Rule hashes of uploaded files not yet written to the draft
+        # metadata (see ``Zenodo.flush_metadata``)
+        self._pending_hashes = {}
+        self._pending_draft = None
+
+        # Caps the number of concurrent downloads (including the byte
+        # ranges fetched by ``Zenodo._download_ranges``) across all threads,
+        # so they never exceed the size of the connection pool
+        self._transfer_slots = threading.BoundedSemaphore(transfer_workers())
+
+        # Guards the file listing cached by ``Zenodo._get_draft_files``,
+        # which may be requested by concurrent uploads
+        self._files_lock = threading.Lock()
 
         # Parse input
         if str(doi_or_service).lower() in services.keys():
@@ -126,33 +388,36 @@ class Zenodo:
             service = services[doi_or_service]
             self.doi_prefix = service["doi_prefix"]
             self.url = service["url"]
+            self._depositions_url = (
+                f"https://{self.url}/api/deposit/depositions"
+            )
             self.token_name = service["token_name"]
             self.access_token = self._get_access_token()
+            self._authenticate()
             self.path = service["path"]
             self.service = service["name"]
             self.doi = self._create(**kwargs)
             self.deposit_id = self.doi.split(self.doi_prefix)[1]
+            self._list_params = self._get_list_params()
             self.user_is_owner = True
 
         else:
 
             # Parse the DOI
             self.doi = doi_or_service
-            try:
-                for service in services.values():
-                    if self.doi.startswith(service["doi_prefix"]):
-                        self.doi_prefix = service["doi_prefix"]
-                        self.deposit_id = self.doi.split(self.doi_prefix)[1]
-                        self.url = service["url"]
-                        self.token_name = service["token_name"]
-                        self.access_token = self._get_access_token()
-                        self.path = service["path"]
-                        self.service = service["name"]
-                        break
-                else:
-                    raise Exception
-            except Exception as e:
-                raise exceptions.InvalidZenodoDOI(self.doi)
+            self.doi_prefix, self.deposit_id, self.url = self.parse_doi(
+                self.doi
+            )
+            self._depositions_url = (
+                f"https://{self.url}/api/deposit/depositions"
+            )
+            service = get_service(self.doi)
+            self.token_name = service["token_name"]
+            self.access_token = self._get_access_token()
+            self._authenticate()
+            self.path = service["path"]
+            self.service = service["name"]
+            self._list_params = self._get_list_params()
 
             # Check if the user is an owner
             try:
@@ -164,6 +429,57 @@ class Zenodo:
                 logger.debug(str(e))
                 self.user_is_owner = False
 
+    @staticmethod
+    def parse_doi(doi):
+        """
+        Parse a deposit DOI without making any requests to the API.
+
+        This is a lightweight alternative to instantiating ``Zenodo`` when
+        only the location of the deposit is needed, since that also checks
+        whether the user is authenticated to edit the deposit.
+
+        Args:
+            doi (str): The deposit DOI.
+
+        Returns:
+            tuple: The DOI prefix, the deposit id, and the URL of the service.
+
+        """
+        service = get_service(doi)
+        deposit_id = doi.split(service["doi_prefix"])[1]
+        return service["doi_prefix"], deposit_id, service["url"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying HTTP session and release its connections.
+
+        """
+        self._session.close()
+
+    def _authenticate(self):
+        """
+        Send the access token (if any) with every request on the session.
+
+        """
+        if self.access_token:
+            self._session.params = {"access_token": self.access_token}
+
+    def _get_list_params(self):
+        """
+        Return the (read-only) query parameters for listing all versions
+        of the deposit.
+
+        """
+        return MappingProxyType(
+            {"q": f"conceptrecid:{self.deposit_id}", "all_versions": 1}
+        )
+
     def _get_access_token(self):
         """
         Return the API access token (stored in an environment variable).
@@ -178,47 +494,39 @@ class Zenodo:
         Caches the result locally.
 
         """
-        cache_file = self.path() / f"{self.deposit_id}" / "id_type.txt"
-
-        if cache_file.exists():
+        key = f"id_type:{self.url}:{self.deposit_id}"
+        id_type = _kvstore.kv_get(key)
+        if id_type is not None:
+            return id_type
 
-            # Restore from cache
-            with open(cache_file, "r") as f:
-                id_type = f.readline().replace("\n", "")
-
-        else:
+        # Try to find a published record (no authentication needed)
+        try:
+            r = self._session.get(
+                f"https://{self.url}/api/records/{self.deposit_id}"
+            )
+            data = r.json()
+        except Exception as e:
+            r = None
+            data = {"status": "", "message": str(e)}
 
-            # Try to find a published record (no authentication needed)
-            try:
-                r = requests.get(
-                    f"https://{self.url}/api/records/{self.deposit_id}"
-                )
-                data = r.json()
-            except Exception as e:
-                r = None
-                data = {"status": "", "message": str(e)}
+        if (r is None) or (r.status_code > 204):
 
-            if (r is None) or (r.status_code > 204):
+            # Either is private or doesn't exist.
+            # In any event, don't cache it, as this could change.
+            return "unknown"
 
-                # Either is private or doesn't exist.
-                # In any event, don't cache it, as this could change.
-                return "unknown"
+        else:
 
+            # This is a public record
+            if int(self.deposit_id) == int(data["conceptrecid"]):
+                id_type = "concept"
+            elif int(self.deposit_id) == int(data["id"]):
+                id_type = "version"
             else:
+                id_type = "unknown"
 
-                # This is a public record
-                if int(self.deposit_id) == int(data["conceptrecid"]):
-                    id_type = "concept"
-                elif int(self.deposit_id) == int(data["id"]):
-                    id_type = "version"
-                else:
-                    id_type = "unknown"
-
-            # Cache it
-            cache_file.parents[0].mkdir(exist_ok=True)
-            with open(cache_file, "w") as f:
-                print(id_type, file=f)
-
+        # Cache it
+        _kvstore.kv_put(key, id_type)
         return id_type
 
     def _create(self, slug=None, branch=None):
@@ -238,11 +546,8 @@ class Zenodo:
 
         # Create the draft
         data = parse_request(
-            requests.post(
-                f"https://{self.url}/api/deposit/depositions",
-                params={
-                    "access_token": self.access_token,
-                },
+            self._session.post(
+                self._depositions_url,
                 json={},
             )
         )
@@ -266,9 +571,8 @@ class Zenodo:
             }
         }
         data = parse_request(
-            requests.put(
+            self._session.put(
                 data["links"]["latest_draft"],
-                params={"access_token": self.access_token},
                 data=json.dumps(metadata),
                 headers={"Content-Type": "application/json"},
             )
@@ -278,60 +582,351 @@ class Zenodo:
         return doi
 
     def check_if_user_is_owner(self):
-        # Logger
-        logger = get_logger()
+        """
+        Returns True if the access token grants edit rights to the deposit.
 
-        # Check if we've tested this already for the given API
-        # token **in this session**. These flags get automatically
-        # deleted during the preprocessing step of every build.
-        cache_file_true = paths.user().flags / f"{self.deposit_id}_AUTH_VALID"
-        cache_file_false = (
-            paths.user().flags / f"{self.deposit_id}_AUTH_INVALID"
-        )
-        if cache_file_true.exists():
-            return True
-        if cache_file_false.exists():
-            return False
+        The result is cached in memory for the lifetime of the process and
+        on disk for ``auth_ttl`` seconds.
 
-        if self.access_token:
+        """
+        if not self.access_token:
+            return False
+        key = (self.url, self.deposit_id, self.access_token)
+        if key not in Zenodo._auth_cache:
+            Zenodo._auth_cache[key] = self._check_if_user_is_owner()
+        return Zenodo._auth_cache[key]
 
-            logger.debug(f"Testing if user is authenticated for {self.doi}...")
+    def _check_if_user_is_owner(self):
+        # Logger
+        logger = get_logger()
 
-            # Search for both concept and version DOIs
-            r = requests.get(
-                f"https://{self.url}/api/deposit/depositions",
-                params={
-                    "q": f"recid:{self.deposit_id} conceptrecid:{self.deposit_id}",
-                    "all_versions": 1,
-                    "access_token": self.access_token,
-                },
-            )
+        # Check if we've tested this already for the given API token.
+        # The token itself is hashed so it's never written to disk
+        token_hash = hashlib.blake2b(
+            self.access_token.encode(), digest_size=8
+        ).hexdigest()
+        key = f"auth:{self.url}:{self.deposit_id}:{token_hash}"
+        cached = _kvstore.kv_get(key, ttl=auth_ttl)
+        if cached is not None:
+            return cached == "1"
+
+        logger.debug(f"Testing if user is authenticated for {self.doi}...")
+
+        # Search for both concept and version DOIs
+        r = self._session.get(
+            self._depositions_url,
+            params={
+                "q": f"recid:{self.deposit_id} conceptrecid:{self.deposit_id}",
+                "all_versions": 1,
+            },
+        )
 
-            # See if we find the deposit
-            if r.status_code <= 204:
-                if type(r.json()) is list and len(r.json()):
-                    if get_run_type() == "build":
-                        logger.info(
-                            f"User authentication for {self.doi} is valid."
-                        )
-                    else:
-                        logger.debug(
-                            f"User authentication for {self.doi} is valid."
-                        )
-                    cache_file_true.touch()
-                    return True
+        # See if we find the deposit
+        if r.status_code <= 204:
+            if type(r.json()) is list and len(r.json()):
+                if get_run_type() == "build":
+                    logger.info(
+                        f"User authentication for {self.doi} is valid."
+                    )
                 else:
                     logger.debug(
-                        "Error establishing whether user is authenticated."
+                        f"User authentication for {self.doi} is valid."
                     )
-                    logger.debug("HTTP response:")
-                    logger.debug(r.text)
+                _kvstore.kv_put(key, "1")
+                return True
+            else:
+                logger.debug(
+                    "Error establishing whether user is authenticated."
+                )
+                logger.debug("HTTP response:")
+                logger.debug(r.text)
+                _kvstore.kv_put(key, "0")
 
         # No dice
         logger.warning(f"User is not authenticated to edit {self.doi}.")
-        cache_file_false.touch()
         return False
 
+    def _upload(self, url, path, tarball=False, md5=None):
+        """
+        Stream the contents of the file at `path` to `url` in a PUT request.
+
+        If `tarball` is True, `path` is a directory, which is tarred and
+        gzipped before it is uploaded. Otherwise, the MD5 of the
+        file is sent along so the server can verify the upload; pass it
+        as `md5` (raw bytes, see ``file_md5``) if it's already known.
+
+        """
+        headers = {"Content-Type": "application/octet-stream"}
+        if not tarball:
+            if md5 is None:
+                md5 = file_md5(path)
+            headers["Content-MD5"] = base64.b64encode(md5).decode()
+        with contextlib.ExitStack() as stack:
+            if tarball:
+                f = stack.enter_context(self._tarball(path))
+            else:
+                f = stack.enter_context(open(path, "rb"))
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size and not tarball:
+                # Serve the body from a memory map rather than with a read
+                # syscall per block (empty files can't be mapped)
+                f = stack.enter_context(
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                )
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    # Read ahead aggressively and free pages soon after
+                    # they've been sent
+                    f.madvise(mmap.MADV_SEQUENTIAL)
+            for attempt in range(http_retries.total + 1):
+                try:
+                    f.seek(0)
+                    with progress(f, "read", size) as reader:
+                        # Zenodo needs the length of the body up front, so
+                        # it must never be sent in chunks
+                        r = self._session.put(
+                            url,
+                            data=SizedReader(reader, size) if size else b"",
+                            headers=headers,
+                        )
+                    r.raise_for_status()
+                    return r
+                except (requests.ConnectionError, requests.HTTPError) as e:
+                    if (
+                        attempt == http_retries.total
+                        or not is_retryable_upload(e)
+                    ):
+                        raise
+                    time.sleep(http_retries.backoff_factor * 2**attempt)
+
+    def _tarball(self, path):
+        """
+        Return a temporary file containing a gzipped tarball of the
+        directory at `path`.
+
+        The tarball is kept in memory unless it's larger than
+        ``tarball_spool_size``, in which case it's spooled to disk.
+
+        """
+        f = tempfile.SpooledTemporaryFile(max_size=tarball_spool_size)
+        try:
+            with tarfile.open(fileobj=f, mode="w:gz") as tb:
+                tb.add(path, arcname=".")
+        except BaseException:
+            f.close()
+            raise
+        return f
+
+    def _download(self, url, path, params=None, tarball=False):
+        """
+        Stream the contents of `url` to the file at `path`.
+
+        If `tarball` is True, the response is a gzipped tarball, which is
+        extracted on the fly into the directory `path`. Large files are
+        fetched in concurrent byte ranges (see ``Zenodo._download_ranges``).
+
+        """
+        with self._transfer_slots, self._session.get(
+            url, params=params, stream=True
+        ) as r:
+            r.raise_for_status()
+            total = int(r.headers.get("Content-Length", 0)) or None
+            ranged = (
+                not tarball
+                and total is not None
+                and total >= ranged_download_size
+                and r.headers.get("Accept-Ranges") == "bytes"
+            )
+            if tarball:
+                r.raw.decode_content = True
+                with progress(r.raw, "read", total) as raw:
+                    with tarfile.open(fileobj=raw, mode="r|gz") as tb:
+                        safe_extract(tb, path)
+            elif not ranged:
+                with open(path, "wb") as f:
+                    with progress(f, "write", total) as out:
+                        for chunk in r.iter_content(chunk_size=1 << 20):
+                            out.write(chunk)
+        if ranged:
+            # Large file: drop this connection and fetch it in pieces
+            self._download_ranges(url, path, total, params=params)
+
+    def _download_ranges(self, url, path, size, params=None):
+        """
+        Download the `size` bytes at `url` to the file at `path` by
+        fetching byte ranges of it concurrently.
+
+        """
+        step = -(-size // transfer_workers())
+        ranges = [
+            (lo, min(lo + step, size) - 1) for lo in range(0, size, step)
+        ]
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+        def fetch_range(bounds):
+            lo, hi = bounds
+            with self._transfer_slots, self._session.get(
+                url,
+                params=params,
+                headers={"Range": f"bytes={lo}-{hi}"},
+                stream=True,
+            ) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise requests.RequestException(
+                        f"Range request to {url} was not honored."
+                    )
+                with open(path, "r+b") as f:
+                    f.seek(lo)
+                    for chunk in r.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                    if f.tell() != hi + 1:
+                        raise requests.RequestException(
+                            f"Incomplete download of bytes {lo}-{hi} of {url}."
+                        )
+
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            list(executor.map(fetch_range, ranges))
+        if os.path.getsize(path) != size:
+            raise requests.RequestException(f"Incomplete download of {url}.")
+
+    def _get_depositions(self):
+        """
+        Return the API response listing all versions of the deposit.
+
+        Successful responses are reused for up to ``depositions_ttl``
+        seconds; methods that modify the deposit reset ``self._depositions``
+        to invalidate it.
+
+        """
+        if (
+            self._depositions is None
+            or time.monotonic() - self._depositions[0] > depositions_ttl
+        ):
+            r = self._session.get(
+                self._depositions_url, params=self._list_params
+            )
+            if r.status_code > 204:
+                # Don't hold on to errors
+                return r
+            self._depositions = (time.monotonic(), r)
+        return self._depositions[1]
+
+    def _ensure_draft(self):
+        """
+        Return the latest draft of the deposit, creating a new version of
+        the deposit if there is no draft.
+
+        The draft is reused for up to ``depositions_ttl`` seconds. Concurrent
+        callers wait for the first one, so that only one new version is
+        created.
+
+        """
+        with self._draft_lock:
+            if (
+                self._draft is None
+                or time.monotonic() - self._draft[0] > depositions_ttl
+            ):
+                self._draft = (time.monotonic(), self._fetch_draft())
+            return self._draft[1]
+
+    def _fetch_draft(self):
+        """
+        Look up (or create) the latest draft of the deposit; see
+        ``Zenodo._ensure_draft``.
+
+        """
+        versions = parse_request(self._get_depositions())
+        if not isinstance(versions, list) or not len(versions):
+            raise exceptions.ZenodoError(
+                message=f"Error accessing latest draft for DOI {self.doi}."
+            )
+        data = versions[0]
+        draft_url = data.get("links", {}).get("latest_draft", None)
+        if not draft_url and not data["submitted"]:
+            draft_url = data["links"]["self"]
+        if not draft_url:
+            # Create a new version. Note that the response describes the
+            # version it was created from, so we still need to fetch the
+            # new draft itself
+            data = parse_request(
+                self._session.post(
+                    f"{self._depositions_url}/{data['id']}/actions/newversion",
+                )
+            )
+            self._depositions = None
+            draft_url = data["links"]["latest_draft"]
+        draft = self._get_draft(draft_url)
+        if draft is None:
+            raise exceptions.ZenodoError(
+                message=f"Error accessing latest draft for DOI {self.doi}."
+            )
+        return draft
+
+    def _get_draft(self, draft_url):
+        """
+        Return the deposit draft at `draft_url`, or ``None`` if it cannot
+        be accessed.
+
+        Drafts are cached on the instance and revalidated against their
+        ETag, so the server only sends the draft again if it has changed.
+
+        """
+        logger = get_logger()
+        etag, draft = self._drafts.get(draft_url, (None, None))
+        headers = {"If-None-Match": etag} if etag else {}
+        r = self._session.get(draft_url, headers=headers)
+        if r.status_code == 304 and draft is not None:
+            return draft
+        try:
+            data = r.json()
+        except ValueError:
+            data = {}
+        if r.status_code > 204 or not isinstance(data, dict):
+            logger.debug(f"Something went wrong accessing {draft_url}.")
+            if isinstance(data, dict) and data.get("message"):
+                logger.debug(data["message"])
+            return None
+        draft = data
+        etag = r.headers.get("ETag")
+        if etag:
+            self._drafts[draft_url] = (etag, draft)
+        return draft
+
+    def _get_draft_files(self, draft):
+        """
+        Return the list of files in a draft.
+
+        The listing is fetched once and cached on the `draft` dict itself;
+        methods that add or remove files from the draft update it in place.
+
+        """
+        with self._files_lock:
+            if "_syw_files" not in draft:
+                draft["_syw_files"] = parse_request(
+                    self._session.get(
+                        draft["links"]["files"],
+                    )
+                )
+        return draft["_syw_files"]
+
+    def _get_rule_hashes(self, deposit):
+        """
+        Return the rule hashes stored in the notes field of a draft or record.
+
+        The parsed dictionary is cached on the `deposit` dict itself, so it is
+        only decoded once and can be updated in place.
+
+        """
+        if "_syw_hashes" not in deposit:
+            notes = deposit["metadata"].get("notes", "{}")
+            try:
+                deposit["_syw_hashes"] = json_loads(notes)
+            except json.JSONDecodeError:
+                raise exceptions.InvalidZenodoNotesField()
+        return deposit["_syw_hashes"]
+
     @require_access_token
     def upload_file_to_draft(self, draft, file, rule_name, tarball=False):
         """
@@ -339,87 +934,178 @@ class Zenodo:
         produced by the same rule, if present.
 
         """
-        # Get rule hashes for the files currently on Zenodo
+        self.upload_files(draft, [(file, rule_name, tarball)])
+
+    @require_access_token
+    def upload_files(self, draft, items):
+        """
+        Upload several files to a Zenodo draft in parallel.
+
+        The provenance (the rule hashes in the notes field of the draft
+        metadata) of new files is only updated in memory; it is written to
+        Zenodo in a single request by ``flush_metadata``, which is called
+        automatically when the process exits. If any file replaced an
+        existing one, the provenance is written right away instead, since
+        until then Zenodo would serve the new file under the old hash. If
+        some of the uploads fail, the provenance of the others is still
+        recorded before the first error is re-raised.
+
+        The number of concurrent uploads is set by the environment variable
+        ``SYW_UPLOAD_WORKERS`` (default 8).
+
+        Args:
+            draft (dict): The draft deposit, as returned by the API.
+            items (list): A list of ``(file, rule_name, tarball)`` tuples.
+
+        """
+        # Upload the files. If any of them fail, we still need to record
+        # the provenance of the others before raising the error
+        with ThreadPoolExecutor(max_workers=transfer_workers()) as executor:
+            futures = [
+                executor.submit(self._upload_file_to_draft, draft, *item)
+                for item in items
+            ]
+        uploaded = []
+        error = None
+        for future in futures:
+            try:
+                uploaded.append(future.result())
+            except Exception as e:
+                uploaded.append(False)
+                error = error or e
+        self._depositions = None
+        if any(uploaded):
+            self._update_provenance(draft, items, uploaded)
+        if error is not None:
+            raise error
+
+    def _update_provenance(self, draft, items, uploaded):
+        """
+        Record the rule hashes of the successfully `uploaded` items (see
+        ``Zenodo.upload_files``).
+
+        """
+        rule_hashes = self._get_rule_hashes(draft)
+        replaced = False
+        for (file, rule_name, _), success in zip(items, uploaded):
+            if success:
+                replaced = replaced or rule_name in rule_hashes
+                rule_hashes[rule_name] = file.name
+                self._pending_hashes[rule_name] = file.name
+        if self._pending_draft is None:
+            atexit.register(self._flush_metadata_at_exit)
+        self._pending_draft = draft
+        if replaced:
+            self.flush_metadata()
+
+    def flush_metadata(self):
+        """
+        Write the rule hashes of all files uploaded by ``upload_files`` to the
+        notes field of the draft metadata.
+
+        """
+        if not self._pending_hashes:
+            return
+
+        # Merge into the current notes, in case the draft changed since we
+        # fetched it
+        draft = self._pending_draft
+        draft = self._get_draft(draft["links"]["latest_draft"]) or draft
+        rule_hashes = self._get_rule_hashes(draft)
+        rule_hashes.update(self._pending_hashes)
         metadata = draft["metadata"]
-        notes = metadata.get("notes", "{}")
+        metadata["notes"] = json_dumps(rule_hashes)
+        parse_request(
+            self._session.put(
+                draft["links"]["latest_draft"],
+                data=json_dumps({"metadata": metadata}),
+                headers={"Content-Type": "application/json"},
+            )
+        )
+        self._pending_hashes = {}
+        self._depositions = None
+
+    def _flush_metadata_at_exit(self):
         try:
-            rule_hashes = json.loads(notes)
-        except json.JSONDecodeError:
-            raise exceptions.InvalidZenodoNotesField()
+            self.flush_metadata()
+        except Exception as e:
+            # NOTE: we treat all Zenodo caching errors as non-fatal
+            logger = get_logger()
+            logger.warning(
+                f"Failed to update the provenance of {self.service} deposit {self.doi}."
+            )
+            if len(str(e)):
+                logger.debug(str(e))
+
+    def _upload_file_to_draft(self, draft, file, rule_name, tarball=False):
+        """
+        Upload a single file to a Zenodo draft without updating its metadata.
 
-        # Search for an existing file on Zenodo
-        rule_hash_on_zenodo = rule_hashes.get(rule_name, None)
+        Returns False if the file on Zenodo was already up to date, and
+        True if its provenance needs to be updated.
+
+        """
+        # Search for an existing file on Zenodo (including files uploaded
+        # in this session whose provenance hasn't been flushed yet)
+        rule_hashes = self._get_rule_hashes(draft)
+        rule_hash_on_zenodo = self._pending_hashes.get(
+            rule_name, rule_hashes.get(rule_name, None)
+        )
+        md5 = None
         if rule_hash_on_zenodo == file.name:
             # The file is up to date
-            return
+            return False
         elif rule_hash_on_zenodo:
-            # Delete the existing file
-            files_url = draft["links"]["files"]
-            data = parse_request(
-                requests.get(
-                    files_url,
-                    params={"access_token": self.access_token},
-                )
-            )
-            for entry in data:
+            files = self._get_draft_files(draft)
+            for entry in list(files):
                 if entry["filename"] == rule_name:
-                    file_id = entry["id"]
+                    if not tarball:
+                        md5 = file_md5(file)
+                        if remote_md5(entry) == md5.hex():
+                            # The contents are unchanged (e.g., the rule
+                            # was re-run), so only the provenance needs
+                            # updating
+                            return True
+
+                    # Delete the existing file
                     parse_request(
-                        requests.delete(
-                            f"{files_url}/{file_id}",
-                            params={"access_token": self.access_token},
+                        self._session.delete(
+                            entry["links"]["self"],
                         )
                     )
+                    files.remove(entry)
                     break
 
-        # If it's a directory, tar it up
-        if tarball:
-            with tarfile.open(f"{file}.tar.gz", "w:gz") as tb:
-                tb.add(file, arcname=".")
-            file_to_upload = Path(f"{file}.tar.gz")
-        else:
-            file_to_upload = file
-
-        # Use curl to upload the file so we have a progress bar
+        # Stream the file to the deposit bucket (directories are tarred
+        # up on the fly)
         bucket_url = draft["links"]["bucket"]
-        progress_bar = (
-            ["--progress-bar"]
-            if not snakemake.workflow.config["github_actions"]
-            else []
-        )
         try:
-            res = subprocess.run(
-                [
-                    "curl",
-                    "-f",
-                    *progress_bar,
-                    "-o",
-                    "/dev/null",
-                    "--upload-file",
-                    str(file_to_upload),
-                    "--request",
-                    "PUT",
-                    f"{bucket_url}/{rule_name}?access_token={self.access_token}",
-                ]
+            r = self._upload(
+                f"{bucket_url}/{rule_name}", file, tarball=tarball, md5=md5
             )
-        except:
+        except requests.RequestException:
             raise exceptions.ZenodoUploadError()
 
-        # Delete the tarball if we created it
-        if tarball:
-            file_to_upload.unlink()
+        # Keep the cached file listing in sync. The bucket API returns the
+        # new object, whose own URL can be used to download or delete it
+        if "_syw_files" in draft:
+            try:
+                data = r.json()
+                draft["_syw_files"].append(
+                    {
+                        "filename": rule_name,
+                        "filesize": data["size"],
+                        "checksum": remote_md5(data),
+                        "links": {
+                            "self": data["links"]["self"],
+                            "download": data["links"]["self"],
+                        },
+                    }
+                )
+            except (ValueError, KeyError):
+                draft.pop("_syw_files", None)
 
-        # Update the provenance
-        rule_hashes[rule_name] = file.name
-        metadata["notes"] = json.dumps(rule_hashes, indent=4)
-        parse_request(
-            requests.put(
-                draft["links"]["latest_draft"],
-                params={"access_token": self.access_token},
-                data=json.dumps({"metadata": metadata}),
-                headers={"Content-Type": "application/json"},
-            )
-        )
+        return True
 
     @require_access_token
     def download_file_from_draft(
@@ -433,116 +1119,40 @@ class Zenodo:
         logger = get_logger()
 
         # Get rule hashes for the files currently on Zenodo
-        metadata = draft["metadata"]
-        notes = metadata.get("notes", "{}")
-        try:
-            rule_hashes = json.loads(notes)
-        except json.JSONDecodeError:
-            raise exceptions.InvalidZenodoNotesField()
+        rule_hashes = self._get_rule_hashes(draft)
 
         # Get the files currently on the remote
-        data = parse_request(
-            requests.get(
-                draft["links"]["files"],
-                params={"access_token": self.access_token},
-            )
-        )
+        data = self._get_draft_files(draft)
 
         # Look for a match
         logger.debug(
             f"Searching for file `{rule_name}` with hash `{file.name}`..."
         )
-        for entry in data:
-
+        files = {entry["filename"]: entry for entry in data}
+        entry = files.get(rule_name, None)
+        if entry is None:
+            logger.debug(f"Cache miss for file {rule_name}. Skipping...")
+        elif rule_hashes.get(rule_name, None) != file.name:
             logger.debug(
-                f"Inspecting candidate file `{entry['filename']}` with hash `{rule_hashes.get(rule_name, None)}`..."
+                f"File {rule_name} found, but it has the wrong hash. Skipping..."
             )
+        else:
 
-            if (
-                entry["filename"] == rule_name
-                and rule_hashes.get(rule_name, None) == file.name
-            ):
-
-                # Download it
-                logger.debug(f"File name and hash both match.")
-                if not dry_run:
-                    logger.debug("Downloading...")
-                    url = entry["links"]["download"]
-                    progress_bar = (
-                        ["--progress-bar"]
-                        if not snakemake.workflow.config["github_actions"]
-                        else []
+            # Download it
+            logger.debug(f"File name and hash both match.")
+            if not dry_run:
+                logger.debug("Downloading...")
+                url = entry["links"]["download"]
+                try:
+                    self._download(
+                        url,
+                        file,
+                        tarball=tarball,
                     )
-                    try:
-                        res = subprocess.run(
-                            [
-                                "curl",
-                                "-f",
-                                f"{url}?access_token={self.access_token}",
-                                *progress_bar,
-                                "--output",
-                                str(file),
-                            ]
-                        )
-                    except:
-                        raise exceptions.ZenodoDownloadError()
-
-                    # If it's a directory tarball, extract it
-                    if tarball:
-                        os.rename(file, f"{file}.tar.gz")
-                        with tarfile.open(f"{file}.tar.gz") as tb:
-
-                            def is_within_directory(directory, target):
-
-                                abs_directory = os.path.abspath(directory)
-                                abs_target = os.path.abspath(target)
+                except requests.RequestException:
+                    raise exceptions.ZenodoDownloadError()
 
-                                prefix = os.path.commonprefix(
-                                    [abs_directory, abs_target]
-                                )
-
-                                return prefix == abs_directory
-
-                            def safe_extract(
-                                tar,
-                                path=".",
-                                members=None,
-                                *,
-                                numeric_owner=False,
-                            ):
-
-                                for member in tar.getmembers():
-                                    member_path = os.path.join(
-                                        path, member.name
-                                    )
-                                    if not is_within_directory(
-                                        path, member_path
-                                    ):
-                                        raise Exception(
-                                            "Attempted Path Traversal in Tar File"
-                                        )
-
-                                tar.extractall(path, members, numeric_owner)
-
-                            safe_extract(tb, file)
-                        Path(f"{file}.tar.gz").unlink()
-
-                return
-
-            elif entry["filename"] == rule_name:
-
-                # We're done with this deposit
-                logger.debug(
-                    f"File {rule_name} found, but it has the wrong hash. Skipping..."
-                )
-                break
-
-            else:
-
-                # Keep looking in this deposit for a file with the right name
-                logger.debug(
-                    f"Cache miss for file {entry['filename']}. Skipping..."
-                )
+            return
 
         # This is caught in the enclosing scope and treated as a cache miss
         raise exceptions.FileNotFoundOnZenodo(rule_name)
@@ -558,88 +1168,30 @@ class Zenodo:
         logger = get_logger()
 
         # Get rule hashes for the files currently on Zenodo
-        metadata = record["metadata"]
-        notes = metadata.get("notes", "{}")
-        try:
-            rule_hashes = json.loads(notes)
-        except json.JSONDecodeError:
-            raise exceptions.InvalidZenodoNotesField()
+        rule_hashes = self._get_rule_hashes(record)
 
         # Look for a match
-        for entry in record["files"]:
-            if (
-                entry["key"] == rule_name
-                and rule_hashes.get(rule_name, None) == file.name
-            ):
-
-                # Download it
-                logger.debug(f"File name and hash both match.")
-                if not dry_run:
-                    logger.debug("Downloading...")
-                    url = entry["links"]["self"]
-                    progress_bar = (
-                        ["--progress-bar"]
-                        if not snakemake.workflow.config["github_actions"]
-                        else []
-                    )
-                    subprocess.run(
-                        [
-                            "curl",
-                            url,
-                            *progress_bar,
-                            "--output",
-                            str(file),
-                        ]
-                    )
-
-                    # If it's a directory tarball, extract it
-                    if tarball:
-                        os.rename(file, f"{file}.tar.gz")
-                        with tarfile.open(f"{file}.tar.gz") as tb:
-
-                            def is_within_directory(directory, target):
-
-                                abs_directory = os.path.abspath(directory)
-                                abs_target = os.path.abspath(target)
-
-                                prefix = os.path.commonprefix(
-                                    [abs_directory, abs_target]
-                                )
-
-                                return prefix == abs_directory
-
-                            def safe_extract(
-                                tar,
-                                path=".",
-                                members=None,
-                                *,
-                                numeric_owner=False,
-                            ):
-
-                                for member in tar.getmembers():
-                                    member_path = os.path.join(
-                                        path, member.name
-                                    )
-                                    if not is_within_directory(
-                                        path, member_path
-                                    ):
-                                        raise Exception(
-                                            "Attempted Path Traversal in Tar File"
-                                        )
-
-                                tar.extractall(path, members, numeric_owner)
-
-                            safe_extract(tb, file)
-                        Path(f"{file}.tar.gz").unlink()
-
-                return
+        files = {entry["key"]: entry for entry in record["files"]}
+        entry = files.get(rule_name, None)
+        if entry is None:
+            logger.debug(f"Cache miss for file {rule_name}. Skipping...")
+        elif rule_hashes.get(rule_name, None) != file.name:
+            logger.debug(
+                f"File {rule_name} found, but it has the wrong hash. Skipping..."
+            )
+        else:
 
-            elif entry["key"] == rule_name:
+            # Download it
+            logger.debug(f"File name and hash both match.")
+            if not dry_run:
+                logger.debug("Downloading...")
+                url = entry["links"]["self"]
+                try:
+                    self._download(url, file, tarball=tarball)
+                except requests.RequestException:
+                    raise exceptions.ZenodoDownloadError()
 
-                logger.debug(
-                    f"File {rule_name} found, but it has the wrong hash. Skipping..."
-                )
-                break
+            return
 
         # This is caught in the enclosing scope and treated as a cache miss
         raise exceptions.FileNotFoundOnZenodo(rule_name)
@@ -657,31 +1209,23 @@ class Zenodo:
         logger.info(
             f"Deleting {self.service} deposit with concept DOI {self.doi}..."
         )
-        r = requests.get(
-            f"https://{self.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{self.deposit_id}",
-                "all_versions": 1,
-                "access_token": self.access_token,
-            },
-        )
+        r = self._get_depositions()
         try:
             for data in r.json():
                 if not data["submitted"]:
                     break
             else:
                 raise Exception
-        except:
+        except Exception:
             raise exceptions.ZenodoRecordNotFound(self.deposit_id)
         version_id = data["id"]
         parse_request(
-            requests.delete(
-                f"https://{self.url}/api/deposit/depositions/{version_id}",
-                params={
-                    "access_token": self.access_token,
-                },
+            self._session.delete(
+                f"{self._depositions_url}/{version_id}",
             )
         )
+        self._depositions = None
+        self._draft = None
         logger.info(f"Successfully deleted deposit {self.doi}.")
 
     @require_access_token
@@ -697,31 +1241,23 @@ class Zenodo:
         logger.info(
             f"Publishing {self.service} deposit with concept DOI {self.doi}..."
         )
-        r = requests.get(
-            f"https://{self.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{self.deposit_id}",
-                "all_versions": 1,
-                "access_token": self.access_token,
-            },
-        )
+        r = self._get_depositions()
         try:
             for data in r.json():
                 if not data["submitted"]:
                     break
             else:
                 raise Exception
-        except:
+        except Exception:
             raise exceptions.ZenodoRecordNotFound(self.deposit_id)
         version_id = data["id"]
         parse_request(
-            requests.post(
-                f"https://{self.url}/api/deposit/depositions/{version_id}/actions/publish",
-                params={
-                    "access_token": self.access_token,
-                },
+            self._session.post(
+                f"{self._depositions_url}/{version_id}/actions/publish",
             )
         )
+        self._depositions = None
+        self._draft = None
         logger.info(f"Successfully published deposit {self.doi}.")
 
     def download_file(self, file, rule_name, tarball=False, dry_run=False):
@@ -743,30 +1279,19 @@ class Zenodo:
         logger.debug(
             f"Attempting to access {self.service} deposit with DOI {self.doi}..."
         )
-        r = requests.get(
-            f"https://{self.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{concept_id}",
-                "all_versions": 1,
-                "access_token": self.access_token,
-            },
-        )
+        r = self._get_depositions()
         if r.status_code <= 204:
             try:
                 data = r.json()
-            except:
+            except ValueError:
                 data = []
             if len(data):
                 data = data[0]
                 draft_url = data.get("links", {}).get("latest_draft", None)
                 if draft_url:
-                    r = requests.get(
-                        draft_url,
-                        params={"access_token": self.access_token},
-                    )
-                    if r.status_code <= 204:
+                    draft = self._get_draft(draft_url)
+                    if draft is not None:
                         try:
-                            draft = r.json()
                             self.download_file_from_draft(
                                 draft,
                                 file,
@@ -781,16 +1306,6 @@ class Zenodo:
                             )
                         else:
                             return
-                    else:
-                        logger.debug(
-                            f"Something went wrong accessing {draft_url}."
-                        )
-                        try:
-                            data = r.json()
-                        except:
-                            pass
-                        else:
-                            logger.debug(data["message"])
             else:
                 logger.debug(
                     f"Failed to access {self.service} deposit with DOI {self.doi}."
@@ -801,7 +1316,7 @@ class Zenodo:
             )
             try:
                 data = r.json()
-            except:
+            except ValueError:
                 pass
             else:
                 logger.debug(data["message"])
@@ -810,11 +1325,11 @@ class Zenodo:
         logger.debug(
             f"Attempting to access {self.service} record with DOI {self.doi}..."
         )
-        r = requests.get(f"https://{self.url}/api/records/{concept_id}")
+        r = self._session.get(f"https://{self.url}/api/records/{concept_id}")
         if r.status_code > 204:
             try:
                 data = r.json()
-            except:
+            except ValueError:
                 data = {}
             if "PID is not registered" in data.get("message", ""):
                 # There is no published record with this id
@@ -831,18 +1346,17 @@ class Zenodo:
         else:
             # There's a published record. Let's search all versions for
             # a file match.
-            r = requests.get(
+            r = self._session.get(
                 f"https://{self.url}/api/records",
                 params={
                     "q": f'conceptdoi:"{self.doi_prefix}{concept_id}"',
-                    "access_token": self.access_token,
                     "all_versions": 1,
                 },
             )
             if r.status_code <= 204:
                 try:
                     records = r.json().get("hits", {}).get("hits", [])
-                except:
+                except (ValueError, AttributeError):
                     records = []
                     logger.debug(
                         f"File {rule_name} not found in record with DOI {self.doi}."
@@ -867,7 +1381,7 @@ class Zenodo:
                 # Something unexpected happened
                 try:
                     data = r.json()
-                except:
+                except ValueError:
                     data = {}
                 raise exceptions.ZenodoError(
                     status=data.get("status", "unknown"),
@@ -891,22 +1405,14 @@ class Zenodo:
 
         # Check if a draft already exists, and create it if not.
         # If authentication fails, return with a gentle warning
-        concept_id = self.deposit_id
-        r = requests.get(
-            f"https://{self.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{concept_id}",
-                "all_versions": 1,
-                "access_token": self.access_token,
-            },
-        )
+        r = self._get_depositions()
         if r.status_code > 204:
             logger.warning(
                 f"{self.service} authentication failed. Unable to upload cache for rule {rule_name}."
             )
             try:
                 data = r.json()
-            except:
+            except ValueError:
                 pass
             else:
                 logger.debug(data["message"])
@@ -914,44 +1420,14 @@ class Zenodo:
 
         try:
             data = r.json()
-        except:
+        except ValueError:
             data = []
-        if len(data):
-            data = data[0]
-        else:
+        if not len(data):
             logger.warning(
                 f"{self.service} authentication failed. Unable to upload cache for rule {rule_name}."
             )
             return
-        draft_url = data.get("links", {}).get("latest_draft", None)
-        if not draft_url and not data["submitted"]:
-            draft_url = data["links"]["self"]
-        if draft_url:
-
-            # Draft exists
-            draft = parse_request(
-                requests.get(
-                    draft_url,
-                    params={"access_token": self.access_token},
-                )
-            )
-
-        else:
-
-            # Create a new draft
-            data = parse_request(
-                requests.post(
-                    f"https://{self.url}/api/deposit/depositions/{data['id']}/actions/newversion",
-                    params={"access_token": self.access_token},
-                )
-            )
-            draft_url = data["links"]["latest_draft"]
-            draft = parse_request(
-                requests.get(
-                    draft_url,
-                    params={"access_token": self.access_token},
-                )
-            )
+        draft = self._ensure_draft()
 
         self.upload_file_to_draft(draft, file, rule_name, tarball=tarball)
 
@@ -960,67 +1436,11 @@ class Zenodo:
         # Logger
         logger = get_logger()
 
-        # Grab the deposit
-        concept_id = self.deposit_id
+        # Grab the draft (creates one if needed)
         logger.debug(
             f"Attempting to access {self.service} deposit with DOI {self.doi}..."
         )
-        r = requests.get(
-            f"https://{self.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{concept_id}",
-                "all_versions": 1,
-                "access_token": self.access_token,
-            },
-        )
-        if r.status_code <= 204:
-            try:
-                data = r.json()
-            except:
-                raise exceptions.ZenodoError(
-                    message=f"Error accessing latest draft for DOI {self.doi}."
-                )
-
-            # Look for a draft
-            if len(data):
-                data = data[0]
-                draft_url = data.get("links", {}).get("latest_draft", None)
-                if not draft_url and not data["submitted"]:
-                    draft_url = data["links"]["self"]
-
-                # Create a new draft if needed
-                if not draft_url:
-                    r = requests.post(
-                        f"https://{self.url}/api/deposit/depositions/{data['id']}/actions/newversion",
-                        params={"access_token": self.access_token},
-                    )
-                    try:
-                        data = r.json()
-                    except:
-                        raise exceptions.ZenodoError(
-                            message=f"Error accessing latest draft for DOI {self.doi}."
-                        )
-                    draft_url = data["links"]["latest_draft"]
-
-                # Grab the draft
-                r = requests.get(
-                    draft_url,
-                    params={"access_token": self.access_token},
-                )
-                if r.status_code <= 204:
-                    draft = r.json()
-                else:
-                    raise exceptions.ZenodoError(
-                        message=f"Error accessing latest draft for DOI {self.doi}."
-                    )
-            else:
-                raise exceptions.ZenodoError(
-                    message=f"Error accessing latest draft for DOI {self.doi}."
-                )
-        else:
-            raise exceptions.ZenodoError(
-                message=f"Error accessing latest draft for DOI {self.doi}."
-            )
+        draft = self._ensure_draft()
 
         # Local folder to save to
         cache_folder = self.path() / f"{self.deposit_id}" / "download"
@@ -1035,27 +1455,25 @@ class Zenodo:
 
         # Download all files
         data = parse_request(
-            requests.get(
+            self._session.get(
                 draft["links"]["files"],
-                params={"access_token": self.access_token},
             )
         )
-        for entry in data:
-            url = entry["links"]["download"]
-            try:
-                res = subprocess.run(
-                    [
-                        "curl",
-                        "-f",
-                        f"{url}?access_token={self.access_token}",
-                        "--progress-bar",
-                        "--output",
-                        entry["filename"],
-                    ],
-                    cwd=cache_folder,
+        try:
+            with ThreadPoolExecutor(
+                max_workers=transfer_workers()
+            ) as executor:
+                list(
+                    executor.map(
+                        lambda entry: self._download(
+                            entry["links"]["download"],
+                            cache_folder / entry["filename"],
+                        ),
+                        data,
+                    )
                 )
-            except:
-                raise exceptions.ZenodoDownloadError()
+        except requests.RequestException:
+            raise exceptions.ZenodoDownloadError()
 
         # Return path to cache folder
         return cache_folder
@@ -1077,68 +1495,13 @@ class Zenodo:
         # The target deposit (creates if needed)
         target_deposit = Zenodo(target_doi_or_service, **kwargs)
 
-        # Grab the target deposit
-        r = requests.get(
-            f"https://{target_deposit.url}/api/deposit/depositions",
-            params={
-                "q": f"conceptrecid:{target_deposit.deposit_id}",
-                "all_versions": 1,
-                "access_token": target_deposit.access_token,
-            },
-        )
-        if r.status_code <= 204:
-            try:
-                data = r.json()
-            except:
-                raise exceptions.ZenodoError(
-                    message=f"Error accessing latest draft for DOI {target_deposit.doi}."
-                )
-
-            # Look for a draft
-            if len(data):
-                data = data[0]
-                draft_url = data.get("links", {}).get("latest_draft", None)
-                if not draft_url and not data["submitted"]:
-                    draft_url = data["links"]["self"]
-
-                # Create a new draft if needed
-                if not draft_url:
-                    r = requests.post(
-                        f"https://{target_deposit.url}/api/deposit/depositions/{data['id']}/actions/newversion",
-                        params={"access_token": target_deposit.access_token},
-                    )
-                    try:
-                        data = r.json()
-                    except:
-                        raise exceptions.ZenodoError(
-                            message=f"Error accessing latest draft for DOI {target_deposit.doi}."
-                        )
-                    draft_url = data["links"]["latest_draft"]
-
-                # Grab the draft
-                r = requests.get(
-                    draft_url,
-                    params={"access_token": target_deposit.access_token},
-                )
-                if r.status_code <= 204:
-                    draft = r.json()
-                else:
-                    raise exceptions.ZenodoError(
-                        message=f"Error accessing latest draft for DOI {target_deposit.doi}."
-                    )
-            else:
-                raise exceptions.ZenodoError(
-                    message=f"Error accessing latest draft for DOI {target_deposit.doi}."
-                )
-        else:
-            raise exceptions.ZenodoError(
-                message=f"Error accessing latest draft for DOI {target_deposit.doi}."
-            )
+        # Grab the target draft (creates one if needed)
+        draft = target_deposit._ensure_draft()
 
         # Get the bucket to upload files to
         bucket_url = draft["links"]["bucket"]
 
-        # Upload metadata
+        # Load the metadata
         with open(cache_folder / ".metadata.json", "r") as f:
             metadata = json.load(f)
         metadata = {
@@ -1150,41 +1513,62 @@ class Zenodo:
                 "notes": metadata.get("notes", "{}"),
             }
         }
-        parse_request(
-            requests.put(
-                draft["links"]["latest_draft"],
-                params={"access_token": target_deposit.access_token},
-                data=json.dumps(metadata),
-                headers={"Content-Type": "application/json"},
-            )
-        )
 
-        # Upload files
+        # Upload the metadata and the files concurrently, skipping files
+        # already in the target draft with the same contents
         logger.info(f"Uploading files to {target_deposit.doi}...")
+        checksums = {
+            entry["filename"]: remote_md5(entry)
+            for entry in target_deposit._get_draft_files(draft)
+        }
+        files = []
         for file in cache_folder.glob("*"):
-
             if file.name == ".metadata.json":
                 continue
-
-            try:
-                res = subprocess.run(
-                    [
-                        "curl",
-                        "-f",
-                        "--progress-bar",
-                        "-o",
-                        "/dev/null",
-                        "--upload-file",
-                        file.name,
-                        "--request",
-                        "PUT",
-                        f"{bucket_url}/{file.name}?access_token={target_deposit.access_token}",
-                    ],
-                    cwd=cache_folder,
+            md5 = None
+            if file.name in checksums:
+                md5 = file_md5(file)
+                if checksums[file.name] == md5.hex():
+                    continue
+            files.append((file, md5))
+        with ThreadPoolExecutor(max_workers=transfer_workers()) as executor:
+            metadata_upload = executor.submit(
+                lambda: parse_request(
+                    target_deposit._session.put(
+                        draft["links"]["latest_draft"],
+                        data=json_dumps(metadata),
+                        headers={"Content-Type": "application/json"},
+                    )
                 )
-            except:
-                raise exceptions.ZenodoUploadError()
+            )
+            file_uploads = [
+                executor.submit(
+                    target_deposit._upload,
+                    f"{bucket_url}/{file.name}",
+                    file,
+                    md5=md5,
+                )
+                for file, md5 in files
+            ]
+        metadata_upload.result()
+        try:
+            for upload in file_uploads:
+                upload.result()
+        except requests.RequestException:
+            raise exceptions.ZenodoUploadError()
 
         # We're done
         logger.info(f"Successfully copied {self.doi} to {target_deposit.doi}.")
         return target_deposit.doi
+
+
+@functools.lru_cache(maxsize=None)
+def get_deposit(doi):
+    """
+    Return a Zenodo interface for the deposit with the given `doi`.
+
+    Instances are memoized, so repeated calls for the same DOI do not
+    re-run the authentication check against the API.
+
+    """
+    return Zenodo(doi)
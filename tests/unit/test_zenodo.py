@@ -0,0 +1,286 @@
+import io
+import tarfile
+import threading
+import types
+
+import pytest
+import requests
+
+from showyourwork import _kvstore, zenodo
+
+
+class MockSession:
+    """
+    Prepares each PUT request the way ``requests`` would before sending it,
+    then reads the body, without making any network calls. Responds with
+    each of `statuses` in turn.
+
+    GET requests are served from `content`, honoring ``Range`` headers if
+    `ranges` is True and ``If-None-Match`` headers if `etag` is set.
+
+    """
+
+    def __init__(self, statuses=(200,), content=b"", ranges=True, etag=None):
+        self.uploads = []
+        self.statuses = list(statuses)
+        self.downloads = []
+        self.content = content
+        self.ranges = ranges
+        self.etag = etag
+
+    def get(self, url, params=None, headers=None, stream=False):
+        headers = headers or {}
+        self.downloads.append(headers)
+        response = requests.Response()
+        response.url = url
+        content = self.content
+        if self.etag and headers.get("If-None-Match") == self.etag:
+            response.status_code = 304
+            content = b""
+        elif self.ranges and "Range" in headers:
+            lo, hi = map(int, headers["Range"][len("bytes=") :].split("-"))
+            response.status_code = 206
+            content = content[lo : hi + 1]
+        else:
+            response.status_code = 200
+            if self.ranges:
+                response.headers["Accept-Ranges"] = "bytes"
+        if self.etag:
+            response.headers["ETag"] = self.etag
+        response.headers["Content-Length"] = str(len(content))
+        response.raw = io.BytesIO(content)
+        return response
+
+    def put(self, url, data=None, headers=None):
+        request = requests.Request("PUT", url, data=data, headers=headers)
+        prepared = request.prepare()
+        if hasattr(prepared.body, "read"):
+            body = b"".join(iter(lambda: prepared.body.read(8192), b""))
+        else:
+            body = prepared.body or b""
+        self.uploads.append((prepared.headers, body))
+        response = requests.Response()
+        response.status_code = self.statuses.pop(0)
+        return response
+
+
+def upload(tmp_path, session):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"showyourwork")
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._session = session
+    return deposit._upload("https://zenodo.org/api/files/bucket/x", path)
+
+
+def test_upload_with_progress_bar(tmp_path):
+    """
+    Test that file uploads wrapped in a ``tqdm`` progress bar are sent in
+    full along with their length.
+
+    """
+    path = tmp_path / "file.bin"
+    contents = b"showyourwork" * 100000
+    path.write_bytes(contents)
+
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._session = MockSession()
+    deposit._upload("https://zenodo.org/api/files/bucket/file.bin", path)
+
+    headers, body = deposit._session.uploads[0]
+    assert headers["Content-Length"] == str(len(contents))
+    assert body == contents
+
+
+def test_upload_retries_server_errors(tmp_path, monkeypatch):
+    """
+    Test that uploads are retried on transient server errors.
+
+    """
+    monkeypatch.setattr(zenodo.time, "sleep", lambda seconds: None)
+    session = MockSession(statuses=(503, 200))
+    assert upload(tmp_path, session).status_code == 200
+    assert len(session.uploads) == 2
+
+
+def test_upload_does_not_retry_client_errors(tmp_path, monkeypatch):
+    """
+    Test that uploads rejected by the server are not retried.
+
+    """
+    monkeypatch.setattr(zenodo.time, "sleep", lambda seconds: None)
+    session = MockSession(statuses=(403,))
+    with pytest.raises(requests.HTTPError):
+        upload(tmp_path, session)
+    assert len(session.uploads) == 1
+
+
+def test_upload_empty_file(tmp_path):
+    """
+    Test that empty files are uploaded with a length rather than in chunks.
+
+    """
+    path = tmp_path / "empty.txt"
+    path.touch()
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._session = MockSession()
+    deposit._upload("https://zenodo.org/api/files/bucket/empty.txt", path)
+
+    headers, body = deposit._session.uploads[0]
+    assert headers["Content-Length"] == "0"
+    assert "Transfer-Encoding" not in headers
+    assert body == b""
+
+
+def test_upload_tarball(tmp_path):
+    """
+    Test that directories are uploaded as gzipped tarballs of known length
+    which extract to the original contents.
+
+    """
+    folder = tmp_path / "folder"
+    (folder / "sub").mkdir(parents=True)
+    (folder / "a.txt").write_text("a")
+    (folder / "sub" / "b.txt").write_text("b" * 100000)
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._session = MockSession()
+    deposit._upload(
+        "https://zenodo.org/api/files/bucket/folder", folder, tarball=True
+    )
+
+    headers, body = deposit._session.uploads[0]
+    assert headers["Content-Length"] == str(len(body))
+    assert "Transfer-Encoding" not in headers
+    output = tmp_path / "output"
+    with tarfile.open(fileobj=io.BytesIO(body), mode="r|gz") as tb:
+        zenodo.safe_extract(tb, output)
+    assert (output / "a.txt").read_text() == "a"
+    assert (output / "sub" / "b.txt").read_text() == "b" * 100000
+
+
+def test_upload_files_records_provenance_on_failure(tmp_path, monkeypatch):
+    """
+    Test that the provenance of files that were uploaded is recorded even
+    if another upload in the same batch fails.
+
+    """
+
+    def upload_file_to_draft(draft, file, rule_name, tarball):
+        if rule_name == "bad":
+            raise requests.ConnectionError()
+        return True
+
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._pending_hashes = {}
+    deposit._pending_draft = None
+    deposit._drafts = {}
+    deposit.access_token = "token"
+    monkeypatch.setattr(zenodo.atexit, "register", lambda func: None)
+    monkeypatch.setattr(deposit, "_upload_file_to_draft", upload_file_to_draft)
+    draft = {"metadata": {"notes": "{}"}}
+    items = [
+        (tmp_path / "hash1", "good", False),
+        (tmp_path / "hash2", "bad", False),
+    ]
+    with pytest.raises(requests.ConnectionError):
+        deposit.upload_files(draft, items)
+    assert deposit._pending_hashes == {"good": "hash1"}
+
+
+def download(session):
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._session = session
+    deposit._transfer_slots = threading.BoundedSemaphore(
+        zenodo.transfer_workers()
+    )
+    return deposit
+
+
+def test_download_ranges(tmp_path, monkeypatch):
+    """
+    Test that large files are fetched in contiguous byte ranges which are
+    reassembled into the original file.
+
+    """
+    monkeypatch.setenv("SYW_UPLOAD_WORKERS", "3")
+    monkeypatch.setattr(zenodo, "ranged_download_size", 1000)
+    contents = bytes(range(256)) * 40
+    session = MockSession(content=contents)
+    path = tmp_path / "file.bin"
+    download(session)._download("https://zenodo.org/file.bin", path)
+
+    assert path.read_bytes() == contents
+    ranges = sorted(
+        tuple(map(int, h["Range"][len("bytes=") :].split("-")))
+        for h in session.downloads
+        if "Range" in h
+    )
+    assert len(ranges) == 3
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(contents) - 1
+    for (_, hi), (lo, _) in zip(ranges, ranges[1:]):
+        assert lo == hi + 1
+
+
+def test_download_ranges_not_honored(tmp_path, monkeypatch):
+    """
+    Test that a full response to a range request is treated as an error
+    rather than written at the offset of the range.
+
+    """
+    monkeypatch.setenv("SYW_UPLOAD_WORKERS", "3")
+    session = MockSession(content=b"showyourwork" * 100, ranges=False)
+    with pytest.raises(requests.RequestException):
+        download(session)._download_ranges(
+            "https://zenodo.org/file.bin", tmp_path / "file.bin", 1200
+        )
+
+
+def test_download_small_file(tmp_path, monkeypatch):
+    """
+    Test that files below ``ranged_download_size`` are fetched in a single
+    request.
+
+    """
+    contents = b"showyourwork" * 100
+    session = MockSession(content=contents)
+    path = tmp_path / "file.bin"
+    download(session)._download("https://zenodo.org/file.bin", path)
+
+    assert path.read_bytes() == contents
+    assert session.downloads == [{}]
+
+
+def test_get_draft_revalidates_etag():
+    """
+    Test that cached drafts are revalidated against their ETag and reused
+    if the server reports that they have not changed.
+
+    """
+    session = MockSession(content=b'{"id": 1}', etag='"v1"')
+    deposit = zenodo.Zenodo.__new__(zenodo.Zenodo)
+    deposit._session = session
+    deposit._drafts = {}
+    url = "https://zenodo.org/api/deposit/depositions/1"
+    draft = deposit._get_draft(url)
+    assert draft == {"id": 1}
+    assert deposit._get_draft(url) is draft
+    assert session.downloads[1] == {"If-None-Match": '"v1"'}
+
+
+def test_kv_get_expiry(tmp_path, monkeypatch):
+    """
+    Test that entries in the key-value store expire after `ttl` seconds.
+
+    """
+    monkeypatch.setattr(
+        _kvstore.paths, "user", lambda: types.SimpleNamespace(temp=tmp_path)
+    )
+    now = 1000000
+    monkeypatch.setattr(_kvstore.time, "time", lambda: now)
+    _kvstore.kv_put("key", "value")
+    assert _kvstore.kv_get("key", ttl=60) == "value"
+    assert _kvstore.kv_get("missing") is None
+
+    now += 61
+    assert _kvstore.kv_get("key", ttl=60) is None
+    assert _kvstore.kv_get("key") == "value"